@@ -0,0 +1,287 @@
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import decompress
+import encoding
+
+# Kinds of synthetic input the suite runs over, see make_corpus
+CORPUS_KINDS = ("uniform", "skewed", "english", "binary")
+
+
+def make_text(size, alphabet="abcdefghijklmnopqrstuvwxyz      eeettaoin\n", seed=0):
+    """Build a reproducible random text to benchmark with.
+
+       Arguments:
+            size (int): The number of characters in the text.
+            alphabet (str): The characters to pick from, repeated characters are picked more often.
+            seed (int): Seed for the random generator so runs are comparable.
+
+        Returns:
+            str : the generated text
+    """
+    rng = random.Random(seed)
+    return "".join(rng.choice(alphabet) for _ in range(size))
+
+def make_corpus(kind, size, seed=0):
+    """Build one synthetic input for the benchmark suite.
+
+       Arguments:
+            kind (str): One of CORPUS_KINDS:
+                        uniform - every printable ASCII character equally likely (high entropy)
+                        skewed  - a few characters make up most of the text (low entropy)
+                        english - words from soup.txt in random order
+                        binary  - random bytes where small values are more likely
+            size (int): The number of characters (bytes for binary) in the input.
+            seed (int): Seed for the random generator so runs are comparable.
+
+        Returns:
+            str or bytes : the generated input
+    """
+    rng = random.Random(seed)
+    if kind == "uniform":
+        alphabet = [chr(code) for code in range(32, 127)]
+        return "".join(rng.choices(alphabet, k=size))
+    if kind == "skewed":
+        alphabet = "etaoinsrhl" + "".join(chr(code) for code in range(65, 91))
+        weights = [2 ** -(index / 2) for index in range(len(alphabet))]
+        return "".join(rng.choices(alphabet, weights, k=size))
+    if kind == "english":
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "soup.txt"), "r") as file:
+            words = file.read().split()
+        pieces = []
+        length = 0
+        while length < size:
+            word = rng.choice(words)
+            pieces.append(word)
+            length += len(word) + 1
+        return " ".join(pieces)[:size]
+    if kind == "binary":
+        return bytes(min(255, int(rng.expovariate(1 / 24))) for _ in range(size))
+    raise ValueError(f"Unknown corpus kind: {kind}")
+
+def peak_memory_kb(function):
+    """Run a function once under tracemalloc and return the most memory it had
+       allocated at any point, in kilobytes. Only this run is measured, so every
+       input gets its own peak instead of the largest one seen so far.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+def best_time(function, repeat=3):
+    """Run a function several times and return the fastest run in seconds
+       together with the value it returned.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def bench_decode(text, repeat=3):
+    """Compare the table driven decoder with the bit by bit tree walk.
+
+       Arguments:
+            text (str): The text to compress and then decode.
+            repeat (int): How many times each decoder is run, the fastest run is reported.
+
+        Returns:
+            dict : seconds and MB/s for each decoder, and whether both outputs match the text
+    """
+    huffman_tree = encoding.build_huffman_tree(text)
+    codes = encoding.generate_codes(huffman_tree)
+    encoded = encoding.encode_text(text, codes).tobytes()
+    size_mb = len(text.encode("utf-8")) / 1e6
+
+    table_time, table_text = best_time(lambda: encoding.decode_text(encoded, huffman_tree, len(text)), repeat)
+    tree_time, tree_text = best_time(lambda: encoding.decode_text_bitwise(encoded, huffman_tree, len(text)), repeat)
+
+    return {
+        "table_seconds": table_time,
+        "table_mb_per_s": size_mb / table_time,
+        "tree_seconds": tree_time,
+        "tree_mb_per_s": size_mb / tree_time,
+        "speedup": tree_time / table_time,
+        "identical": table_text == tree_text == text,
+    }
+
+def bench_encode(text, repeat=3):
+    """Time encode_text on one text.
+
+       Arguments:
+            text (str or bytes): The text to encode.
+            repeat (int): How many times the encoder is run, the fastest run is reported.
+
+        Returns:
+            dict : seconds and MB/s of the encoder
+    """
+    codes = encoding.canonical_codes(encoding.huffman_code_lengths(encoding.count_frequencies(text)))
+    size_mb = (len(text.encode("utf-8")) if isinstance(text, str) else len(text)) / 1e6
+
+    encode_time, _ = best_time(lambda: encoding.encode_text(text, codes), repeat)
+
+    return {
+        "seconds": encode_time,
+        "mb_per_s": size_mb / encode_time,
+    }
+
+def bench_codes_file(text, repeat=3):
+    """Time the codes-file driven path in decompress.py on one text.
+
+       The MB/s of both functions should stay about the same as the text grows,
+       which shows they run in linear time.
+
+       Arguments:
+            text (str): The text to encode and decode with a huffmanCodes.txt style code map.
+            repeat (int): How many times each function is run, the fastest run is reported.
+
+        Returns:
+            dict : seconds and MB/s for encode_with_huffman and decode_from_huffman_codes,
+                   and whether the decoded text matches
+    """
+    codes = encoding.canonical_codes(encoding.huffman_code_lengths(encoding.count_frequencies(text)))
+    code_map = {code: char for char, code in codes.items()}
+    size_mb = len(text.encode("utf-8")) / 1e6
+
+    encode_time, encoded_bits = best_time(lambda: decompress.encode_with_huffman(text, code_map), repeat)
+    decode_time, decoded = best_time(lambda: decompress.decode_from_huffman_codes(encoded_bits, code_map), repeat)
+
+    return {
+        "encode_seconds": encode_time,
+        "encode_mb_per_s": size_mb / encode_time,
+        "decode_seconds": decode_time,
+        "decode_mb_per_s": size_mb / decode_time,
+        "identical": decoded == text,
+    }
+
+def bench_stages(data, repeat=3):
+    """Time every stage of the compression pipeline on one input.
+
+       The stages are build_huffman_tree, generate_codes, encode_text, decode_text and,
+       for text inputs, decompress.decode_from_huffman_codes on the same codes.
+
+       Arguments:
+            data (str or bytes): The input to compress and decompress.
+            repeat (int): How many times each stage is run, the fastest run is reported.
+
+        Returns:
+            dict : seconds and MB/s for every stage, the compression ratio, the peak memory
+                   of one untimed run of the stages and whether the decoded output matches
+                   the input
+    """
+    size_bytes = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+    size_mb = size_bytes / 1e6
+    stages = {}
+
+    def record(name, function):
+        seconds, result = best_time(function, repeat)
+        stages[name] = {"seconds": seconds, "mb_per_s": size_mb / seconds if seconds else None}
+        return result
+
+    huffman_tree = record("build_huffman_tree", lambda: encoding.build_huffman_tree(data))
+    codes = record("generate_codes", lambda: encoding.generate_codes(huffman_tree))
+    encoded = record("encode_text", lambda: encoding.encode_text(data, codes))
+    encoded_bytes = encoded.tobytes()
+    decoded = record("decode_text", lambda: encoding.decode_text(encoded_bytes, huffman_tree, len(data)))
+    correct = decoded == data
+
+    if isinstance(data, str):
+        code_map = {code: char for char, code in codes.items()}
+        encoded_bits = encoded.to01()
+        decoded = record("decode_from_huffman_codes", lambda: decompress.decode_from_huffman_codes(encoded_bits, code_map))
+        correct = correct and decoded == data
+
+    def run_stages():
+        tree = encoding.build_huffman_tree(data)
+        encoded = encoding.encode_text(data, encoding.generate_codes(tree)).tobytes()
+        encoding.decode_text(encoded, tree, len(data))
+
+    return {
+        "input_bytes": size_bytes,
+        "compressed_bytes": len(encoded_bytes),
+        "compression_ratio": len(encoded_bytes) / size_bytes if size_bytes else None,
+        "stages": stages,
+        "peak_memory_kb": peak_memory_kb(run_stages),
+        "correct": correct,
+    }
+
+def run_suite(sizes, kinds=CORPUS_KINDS, repeat=3):
+    """Run bench_stages over every corpus kind and size.
+
+        Returns:
+            dict : the environment the suite ran in and one result per input
+    """
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            results.append({"corpus": kind, "size": size, **bench_stages(make_corpus(kind, size), repeat)})
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": encoding.numpy is not None,
+        "results": results,
+    }
+
+def main():
+    """
+        Main function :
+            python benchmark.py [--json output.json] [size ...]
+                * Runs every pipeline stage over uniform, skewed, English and binary
+                  inputs of the given sizes
+                * Prints the results as JSON, or writes them to the given file, so
+                  runs can be compared between releases
+            python benchmark.py --compare [size ...]
+                * Times the encoder, and compares the table decoder with the
+                  tree walk, on generated texts of the given sizes
+                * Shows the throughput of the decompress.py codes-file path at
+                  every size, which stays flat when it runs in linear time
+    """
+    args = sys.argv[1:]
+    if "--compare" in args:
+        args.remove("--compare")
+        compare([int(arg) for arg in args] or [100_000, 1_000_000])
+        return
+
+    output_path = None
+    if "--json" in args:
+        position = args.index("--json")
+        output_path = args[position + 1]
+        del args[position:position + 2]
+
+    report = json.dumps(run_suite([int(arg) for arg in args] or [10_000, 100_000]), indent=2)
+    if output_path:
+        with open(output_path, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+def compare(sizes):
+    """Print the encoder and decoder comparisons for generated texts of the given sizes."""
+    for size in sizes:
+        text = make_text(size)
+        result = bench_encode(text)
+        print(f"{size} chars encode: {result['mb_per_s']:.2f} MB/s")
+        result = bench_decode(text)
+        print(f"{size} chars decode: table {result['table_mb_per_s']:.2f} MB/s | "
+              f"tree {result['tree_mb_per_s']:.2f} MB/s | "
+              f"speedup {result['speedup']:.2f}x | identical: {result['identical']}")
+        result = bench_codes_file(text)
+        print(f"{size} chars codes file: encode_with_huffman {result['encode_mb_per_s']:.2f} MB/s | "
+              f"decode_from_huffman_codes {result['decode_mb_per_s']:.2f} MB/s | "
+              f"identical: {result['identical']}")
+
+if __name__ == "__main__":
+    main()
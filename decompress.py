@@ -1,6 +1,8 @@
 import os
 import sys
-from bitarray import bitarray
+from bitarray import bitarray, decodetree
+
+import encoding
 
 def read_huffman_codes(code_file_path):
     """Read Huffman codes from the provided text file. 
@@ -47,29 +49,55 @@ def read_huffman_codes(code_file_path):
         print(f"Error reading code file: {e}")
         return None
 
+def read_code_lengths_file(lengths_file_path):
+    """Read a compact code length table saved by encoding.save_code_lengths_to_file
+       and rebuild the canonical Huffman codes from it.
+
+       Arguments:
+            lengths_file_path (str): The path to the binary code length file.
+
+        Returns:
+            a dictionary where keys are huffman codes and values are the corresponding
+            characters, the same as read_huffman_codes.
+            In case that an error occurs while reading the file, it will return None.
+    """
+    try:
+        with open(lengths_file_path, 'rb') as file:
+            lengths = encoding.read_code_lengths(file)
+        return {code: char for char, code in encoding.canonical_codes(lengths).items()}
+    except Exception as e:
+        print(f"Error reading code length file: {e}")
+        return None
+
 def decode_from_huffman_codes(encoded_bits, code_map):
     """Decode a bit string using the Huffman code map
+
+       The codes are turned into a bitarray decode tree once, and bitarray walks
+       it in C, so the time grows linearly with the number of bits instead of
+       building strings one bit at a time.
        
        Arguments:
-            encoded_bits : is an encoded string of bits to be decoded
+            encoded_bits : is an encoded string of bits (or a bitarray) to be decoded
             code_map (dict): A dictionary where keys  are Huffman codes
             and values are characters.
 
         Returns:
-             str : decoded text
+             str : decoded text, up to the last complete code. Bits after it that do
+                   not form a code, such as the padding of the last byte of a file,
+                   are dropped.
     """
-    decoded_text = ""
-    current_code = ""
-    
-    # Iterates through the encoded bits to form valid codes
-    for bit in encoded_bits:
-        current_code += bit
-        if current_code in code_map:
-            # Map the code to the corresponding character
-            decoded_text += code_map[current_code]
-            current_code = ""
-            
-    return decoded_text
+    if not isinstance(encoded_bits, bitarray):
+        encoded_bits = bitarray(encoded_bits)
+    if not encoded_bits or not code_map:
+        return ""
+
+    tree = decodetree({char: bitarray(code) for code, char in code_map.items()})
+    decoded_text = []
+    try:
+        decoded_text.extend(encoded_bits.decode(tree))
+    except ValueError:
+        pass  # the remaining bits are not a complete code
+    return "".join(decoded_text)
 
 def read_original_text(file_path):
     """Read the original text file .
@@ -99,17 +127,20 @@ def encode_with_huffman(text, codes_reverse):
             string : The encoded binary string    
     """
     # Reverse the code map for encoding
-    codes = {v: k for k, v in codes_reverse.items()}
-    
-    encoded = ""
+    codes = {v: bitarray(k) for k, v in codes_reverse.items()}
+
+    # Characters without a code are left out, with a warning for each of them
+    missing = set(text) - codes.keys()
+    for char in missing:
+        print(f"Warning: Character '{char}' not found in Huffman codes ({text.count(char)} times)")
+    if missing:
+        text = text.translate({ord(char): None for char in missing})
+
     # This encodes each character in the text
-    for char in text:
-        if char in codes:
-            encoded += codes[char]
-        else:
-            print(f"Warning: Character '{char}' not found in Huffman codes")
-     
-    return encoded
+    encoded = bitarray()
+    if text:
+        encoded.encode(codes, text)
+    return encoded.to01()
 
 def main():
     """ 
@@ -1,6 +1,10 @@
 from tkinter import ttk
 from tkinter import scrolledtext
 from tkinter import filedialog
+from collections import Counter
+import os
+import queue
+import threading
 import tkinter
 
 import encoding
@@ -14,22 +18,52 @@ ogSizeInt = "N/A"
 cSizeInt = "N/A"
 ratioStr = "N/A"
 
-#var for the huffman tree
-treePtr = None
+#the background job (encode or decode) that is running, messages it sends back
+#to the main thread, and the event that asks it to stop
+workerThread = None
+workerQueue = queue.Queue()
+cancelEvent = threading.Event()
+
+#how often (in ms) the main thread checks for messages from the worker
+POLL_INTERVAL = 50
+
+#the text file that was loaded, it is compressed straight from disk
+#unless the text box was edited after loading it
+loadedFilePath = None
+
+#how many characters of a file the text boxes show, so large files don't
+#slow the window down
+PREVIEW_CHARS = 100_000
+
+#the compressed and decompressed files live next to encoding.py, wherever
+#the window was started from
+outputDir = os.path.dirname(os.path.abspath(encoding.__file__))
+compressedPath = os.path.join(outputDir, "compressedBinary.txt")
+decompressedPath = os.path.join(outputDir, "decompressed.txt")
 
 ##########################################################################
 
 
+"""
+Raised inside a worker when the cancel button was pressed, so it stops
+wherever it is.
+"""
+class Cancelled(Exception):
+    pass
+
+
 """
 Opens a file dialog to select a .txt file in order to read its content. 
 
 This function allows the user to choose a text file from their system and 
-return its content as a string. It checks if the selected file is a valid 
-text file and handles potential errors.
+return its path together with a preview of its content. Only the first
+PREVIEW_CHARS characters are read, however large the file is. It checks
+if the selected file is a valid text file and handles potential errors.
 
 Returns :
-        textContent (string) : content of the selected file as a string IF
-                              successful. Else if error occurs 'None' is returned
+        (filePath, preview) (tuple) : path of the selected file and the start
+                              of its content IF successful. Else if error occurs
+                              'None' is returned
 """
 def getFile():
     try:
@@ -39,8 +73,8 @@ def getFile():
             return
     
         with open(filePath, 'r') as file:
-            textContent = file.read()
-            return textContent
+            preview = file.read(PREVIEW_CHARS)
+            return filePath, preview
         
     except FileNotFoundError:
         print("Error oh no. Probably a pathing error")
@@ -49,18 +83,18 @@ def getFile():
 
 """
  Function for changing the text in the text box for the huffman codes.
- Reads the generated Huffman codes from 'huffmanCodes.txt' and inserts
- them into the provided text box. 
+ Shows the Huffman codes that were just generated, straight from memory,
+ in the same layout as 'huffmanCodes.txt'.
+
+    Args:
+        textEntry (tkinter.Text): The text box where the codes will be displayed.
 
- This function also reads the content of the file and displays the codes in the 
- textbox.
+        codes (dictionary): The Huffman codes of every character.
 """
 
-def getHuffmanTextFF(textEntry):
+def getHuffmanTextFF(textEntry, codes):
     try:
-        textContent = ""
-        with open("huffmanCodes.txt", 'r') as file:
-            textContent = file.read()
+        textContent = encoding.format_huffman_codes(codes)
         textEntry.config(state="normal")
         textEntry.delete('1.0', tkinter.END)
         textEntry.insert(tkinter.INSERT, textContent)
@@ -71,72 +105,209 @@ def getHuffmanTextFF(textEntry):
 """
  Loads the contents of the selected text file and inserts it into 
  the provided textbox. This function also a file selection window to load a text file 
- and inserts its contents into the specified text box. The file content is 
- also passed to the Huffman encoding function in order to generate the codes themselves.
+ and inserts a preview of its contents into the specified text box. The file itself
+ is what gets encoded, unless the text box is edited first. The codes themselves are
+ generated when the text is encoded.
 
 """
 def getTextFF(textEntry):
+    global loadedFilePath
     try:
-        text = getFile()
-        encoding.build_huffman_tree(text)
+        selected = getFile()
+        if selected is None:
+            return
+        loadedFilePath, preview = selected
         textEntry.delete('1.0', tkinter.END)
-        textEntry.insert(tkinter.INSERT, text)
+        textEntry.insert(tkinter.INSERT, preview)
+        textEntry.edit_modified(False)      #any edit after this means the text box is encoded instead
+        if len(preview) == PREVIEW_CHARS:
+            infoTextBox.config(text=f"Loaded {os.path.basename(loadedFilePath)} ({os.path.getsize(loadedFilePath)} bytes), "
+                                    f"showing the first {PREVIEW_CHARS} characters")
     except:
         print("oh no")
 
 """
-Function for performing the encoding process when the button is pushed.
-This function retrieves the text from the input box, generates Huffman codes
-and updates the Huffman codes and compression information.
+Starts a background job, unless one is already running. The job runs
+in its own thread and sends its results back through workerQueue, so
+the window keeps responding while it works.
 
     Args:
-        textEntry (tkinter.Text): The text box containing the text to be encoded.
+        target (function): The job, it is called with the given arguments.
 
-        huffEntry (tkinter.Text):The text box where the Huffman codes will be displayed.
+    Returns:
+        bool: True if the job was started.
+"""
+def startWorker(target, *args):
+    global workerThread
+    if workerThread is not None and workerThread.is_alive():
+        print("Already busy, wait or press cancel")
+        return False
+
+    cancelEvent.clear()
+    progressBar.config(value=0)
+    cancelButton.config(state="normal")
+    workerThread = threading.Thread(target=target, args=args, daemon=True)
+    workerThread.start()
+    return True
 
-        infoBox (ttk.Label): The label that displays compression information.
+"""
+Reports how far along the job is, and stops it if cancel was pressed.
+Runs in the worker thread.
+"""
+def reportProgress(done, total):
+    if cancelEvent.is_set():
+        raise Cancelled()
+    workerQueue.put(("progress", done * 100 / total if total else 100))
+
+"""
+The encoding job. Generates the Huffman codes, saves them to
+'huffmanCodes.txt' and compresses the text to 'compressedBinary.txt'.
+A loaded file is compressed straight from disk, in chunks, instead of
+going through the text box. Runs in the worker thread.
+
+    Args:
+        text (string): The text to encode, or None to encode the file at filePath.
+
+        filePath (string): The text file to encode when there is no text.
+"""
+def encodeWorker(text, filePath=None):
+    outputPath = compressedPath
+    try:
+        if text is None:
+            _, stats = encoding.compress_file_streaming(filePath, outputPath, progress=reportProgress, with_stats=True)
+            with open(outputPath, 'rb') as file:
+                lengths, _, _ = encoding.read_header(file)
+        else:
+            frequency = Counter(text)
+            lengths, _ = encoding.get_code_table(frequency)
+            encoding.save_compressed_file(text, outputPath, lengths, progress=reportProgress)
+            stats = encoding.compression_stats(frequency, lengths)
+        codes = encoding.canonical_codes(lengths)
+        encoding.save_huffman_codes_to_file(codes)
+
+        workerQueue.put(("encoded", codes, stats))
+    except Cancelled:
+        if os.path.exists(outputPath):
+            os.remove(outputPath)
+        workerQueue.put(("cancelled",))
+    except Exception as e:
+        workerQueue.put(("error", f"no encode: {e}"))
 
-    Returns:
-        None
 """
-def encodeText(textEntry, huffEntry, infoBox):
-    global treePtr
+The decoding job. Decompresses 'compressedBinary.txt' piece by piece,
+saves the text to 'decompressed.txt' and sends the first PREVIEW_CHARS
+characters back so they are shown while the rest is still being decoded.
+The rest only goes to the file. Runs in the worker thread.
+"""
+def decodeWorker():
+    try:
+        with open(compressedPath, 'rb') as file, open(decompressedPath, 'w') as outFile:
+            total = os.fstat(file.fileno()).st_size
+            shown = 0
+            for piece in encoding.iter_decompress(file):
+                outFile.write(piece)
+                if shown < PREVIEW_CHARS:
+                    workerQueue.put(("text", piece[:PREVIEW_CHARS - shown]))
+                shown += len(piece)
+                reportProgress(file.tell(), total)
+            if shown > PREVIEW_CHARS:
+                workerQueue.put(("text", f"\n\n... {shown - PREVIEW_CHARS} more characters in decompressed.txt"))
+        workerQueue.put(("decoded",))
+    except Cancelled:
+        workerQueue.put(("cancelled",))
+    except Exception as e:
+        workerQueue.put(("error", f"no decompress: {e}"))
+
+"""
+Handles the messages from the worker on the main thread (tkinter widgets
+must only be used there), then checks again after POLL_INTERVAL ms.
+"""
+def pollWorker():
     global ogSizeInt
     global cSizeInt
     global ratioStr
 
-    text = textEntry.get("1.0", tkinter.END)        #delete the original text in the OG textbox
-    # build the huffman tree and generate huffman codes
-    treePtr = encoding.build_huffman_tree(text)
-    encoding.getHFFMCodes(text)
+    try:
+        while True:
+            message = workerQueue.get_nowait()
+            kind = message[0]
+            if kind == "progress":
+                progressBar.config(value=message[1])
+            elif kind == "text":
+                entryD.insert(tkinter.END, message[1])
+            elif kind == "encoded":
+                _, codes, stats = message
+                ogSizeInt = stats.original_size
+                cSizeInt = stats.compressed_bytes
+                ratioStr = stats.compression_percentage
+                # this will update compression information in the GUI
+                infoTextBox.config(text=f"OG Size: {ogSizeInt} bytes | Compressed Size: {cSizeInt} bytes | Ratio: {ratioStr:.2f}% | "
+                                        f"Efficiency: {stats.efficiency * 100:.1f}%")
+                getHuffmanTextFF(huffmanCodesTextBox, codes)
+                finishWorker()
+            elif kind == "decoded":
+                finishWorker()
+            elif kind == "cancelled":
+                print("cancelled")
+                progressBar.config(value=0)
+                finishWorker()
+            elif kind == "error":
+                print(message[1])
+                finishWorker()
+    except queue.Empty:
+        pass
+    root.after(POLL_INTERVAL, pollWorker)
 
-    ogSizeInt = encoding.original_size
-    cSizeInt = encoding.compressed_bytes
-    ratioStr = encoding.compression_percentage
-    # this will update compression information in the GUI
-    infoBox.config(text=f"OG Size: {ogSizeInt} bytes | Compressed Size: {cSizeInt} bytes | Ratio: {ratioStr:.2f}%")
-    print()
+"""
+Puts the widgets back to their idle state once a job is over.
+"""
+def finishWorker():
+    entryD.config(state="disabled")
+    cancelButton.config(state="disabled")
+
+"""
+Function for performing the encoding process when the button is pushed.
+This function starts the background job that generates the Huffman codes
+and the compressed file, for the loaded file if the input box still shows
+its unedited preview, or else for the text in the input box.
+The Huffman codes and compression information are updated once it is done.
+
+    Args:
+        textEntry (tkinter.Text): The text box containing the text to be encoded.
 
-    getHuffmanTextFF(huffEntry)
+    Returns:
+        None
+"""
+def encodeText(textEntry):
+    if loadedFilePath is not None and not textEntry.edit_modified():
+        startWorker(encodeWorker, None, loadedFilePath)
+    else:
+        text = textEntry.get("1.0", "end-1c")        #widgets can only be read on the main thread, "end-1c" leaves out Tk's trailing newline
+        startWorker(encodeWorker, text)
 
 """
 Function for when the decompression button is pressed.  
 Decompresses the encoded binary file and displays the decompressed text in the GUI.
-This function decompresses the contents of 'compressedBinary.txt' using the generated
-Huffman tree and inserts the decompressed text into the specified text box.
+The background job decompresses 'compressedBinary.txt' using the code table
+stored in its header, and the text box shows every decoded piece as soon as
+it arrives.
 
     Args:
         textEntry (tkinter.Text): The text box where the decompressed text will be displayed.
 """
 def decompressText(textEntry):
-    try:
-        newText = encoding.decompress_file("compressedBinary.txt", treePtr)
-        textEntry.config(state="normal")
-        textEntry.delete('1.0', tkinter.END)
-        textEntry.insert(tkinter.INSERT, newText)
-        textEntry.config(state="disabled")
-    except:
-        print("no decompress")
+    if workerThread is not None and workerThread.is_alive():
+        print("Already busy, wait or press cancel")
+        return
+    textEntry.config(state="normal")
+    textEntry.delete('1.0', tkinter.END)
+    startWorker(decodeWorker)
+
+"""
+Function for when the cancel button is pressed. Asks the running job to stop.
+"""
+def cancelWork():
+    cancelEvent.set()
 
 ########################################
 
@@ -181,7 +352,7 @@ entryE.grid(column=0, row=3, pady=10)
 
 #the load and encode buttons (on the same row because of the buttonFrame tkinter frame)
 loadFile = ttk.Button(buttonFrame, text="Load Text To Encode File", command=lambda: getTextFF(entryE)).grid(column=1, row=2, padx=14)
-encode = ttk.Button(buttonFrame, text="Encode", command=lambda: encodeText(entryE, huffmanCodesTextBox, infoTextBox)).grid(column=0, row=2)
+encode = ttk.Button(buttonFrame, text="Encode", command=lambda: encodeText(entryE)).grid(column=0, row=2)
 
 #huffman section of gui
 ##########################################################################
@@ -202,9 +373,18 @@ entryD.config(state="disabled")
 #decode button
 decode = ttk.Button(root, text="Decode", command=lambda: decompressText(entryD)).grid(column=0, row=7)
 
+#progress of the running encode or decode, and the button that cancels it
+progressFrame = ttk.Frame(root, padding=5, style='W.TFrame')
+progressFrame.grid(column=0, row=9)
+progressBar = ttk.Progressbar(progressFrame, orient="horizontal", length=400, mode="determinate", maximum=100)
+progressBar.grid(column=0, row=0, padx=14)
+cancelButton = ttk.Button(progressFrame, text="Cancel", command=cancelWork, state="disabled")
+cancelButton.grid(column=1, row=0)
+
 #quit button
-quitButton = ttk.Button(root, text="Quit", command=root.destroy).grid(column=0, row=9)
+quitButton = ttk.Button(root, text="Quit", command=root.destroy).grid(column=0, row=10)
 
 #main window loop
+root.after(POLL_INTERVAL, pollWorker)
 root.mainloop()
 
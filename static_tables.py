@@ -0,0 +1,216 @@
+"""
+Pre-trained (static) Huffman code tables for many small messages.
+
+A table is trained once from a sample corpus and saved in a compact binary file.
+Messages are then compressed against it by table ID, with no code table in every
+message. Characters that the table does not cover are written with an escape code
+followed by the character itself, so nothing is ever dropped.
+"""
+import io
+import sys
+import zlib
+from collections import Counter, namedtuple
+from bitarray import bitarray
+
+import encoding
+
+# Escape symbols: they can never be a character (or byte value) of a message
+TEXT_ESCAPE = ""
+BYTES_ESCAPE = 256
+
+# Bits written after an escape code: enough for any Unicode code point, or one byte
+TEXT_LITERAL_BITS = 21
+BYTES_LITERAL_BITS = 8
+
+# Static table file header
+TABLE_MAGIC = b"HUFT"
+TABLE_VERSION = 1
+
+# A trained table: its ID, the code lengths (escape included) and whether it codes bytes
+StaticTable = namedtuple("StaticTable", ["table_id", "lengths", "binary"])
+
+# Registered tables by ID, and the encoder/decoder built for each of them
+tables = {}
+prepared = {}
+
+
+"""
+    Trains a static code table from sample messages.
+
+    Args:
+        samples (iterable): Sample messages, all strings or all bytes.
+        max_symbols (int): Only give codes to this many of the most frequent characters, the
+                           rest are escaped. None gives every character in the samples a code.
+
+    Returns:
+        StaticTable: The trained table, also registered under its ID.
+"""
+def train_table(samples, max_symbols=None):
+    frequency = Counter()
+    binary = None
+    for sample in samples:
+        if binary is None:
+            binary = not isinstance(sample, str)
+        frequency.update(encoding.count_frequencies(sample))
+
+    escaped = 0
+    if max_symbols is not None:
+        kept = Counter(dict(frequency.most_common(max_symbols)))
+        escaped = sum(frequency.values()) - sum(kept.values())
+        frequency = kept
+    escape = BYTES_ESCAPE if binary else TEXT_ESCAPE
+    # The escape is as frequent as the characters it stands for, and at least 1 so it
+    # always has a code
+    frequency[escape] = max(escaped, 1)
+
+    return register_table(make_table(encoding.huffman_code_lengths(frequency), bool(binary)))
+
+"""
+    Builds a StaticTable from code lengths, with an ID computed from the lengths so the
+    same table always gets the same ID.
+"""
+def make_table(lengths, binary):
+    return StaticTable(zlib.crc32(encode_table_body(lengths, binary)), lengths, binary)
+
+"""
+    Packs the code lengths of a table: the escape code length (1 byte) followed by the
+    lengths of every other symbol (see encoding.encode_code_lengths).
+"""
+def encode_table_body(lengths, binary):
+    escape = BYTES_ESCAPE if binary else TEXT_ESCAPE
+    symbols = {char: length for char, length in lengths.items() if char != escape}
+    return bytes([lengths[escape]]) + encoding.encode_code_lengths(symbols)
+
+"""
+    Saves a table to a binary file:
+
+        magic bytes 'HUFT' | version (1 byte) | 1 for bytes tables, 0 for text (1 byte)
+        table ID (4 bytes) | escape code length (1 byte) | code length table
+
+    Args:
+        table (StaticTable): The table to save.
+        output_path (string): The path of the file to write.
+
+    Returns:
+        output_path (string): The path of the saved table.
+"""
+def save_table(table, output_path):
+    with open(output_path, "wb") as file:
+        file.write(TABLE_MAGIC + bytes([TABLE_VERSION, int(table.binary)]))
+        file.write(table.table_id.to_bytes(4, "big"))
+        file.write(encode_table_body(table.lengths, table.binary))
+    return output_path
+
+"""
+    Loads a table saved by save_table and registers it under its ID.
+
+    Args:
+        input_path (string): The path of the table file.
+
+    Returns:
+        StaticTable: The loaded table.
+"""
+def load_table(input_path):
+    with open(input_path, "rb") as file:
+        if file.read(len(TABLE_MAGIC)) != TABLE_MAGIC:
+            raise ValueError("Not a static Huffman table file")
+        version, binary = file.read(2)
+        if version != TABLE_VERSION:
+            raise ValueError(f"Unsupported static table version: {version}")
+        table_id = int.from_bytes(file.read(4), "big")
+        escape_length = file.read(1)[0]
+        lengths = encoding.read_code_lengths(file, bool(binary))
+
+    lengths[BYTES_ESCAPE if binary else TEXT_ESCAPE] = escape_length
+    table = make_table(lengths, bool(binary))
+    if table.table_id != table_id:
+        raise ValueError("Static table file is corrupted, its ID does not match its contents")
+    return register_table(table)
+
+"""
+    Makes a table available to compress_message and decompress_message by its ID.
+"""
+def register_table(table):
+    tables[table.table_id] = table
+    prepared.pop(table.table_id, None)
+    return table
+
+"""
+    Returns the bitarray codes and the decode table of a registered table, building them
+    the first time the table is used.
+"""
+def prepare_table(table_id):
+    if table_id not in prepared:
+        if table_id not in tables:
+            raise KeyError(f"No static table with ID {table_id:#010x} is registered")
+        table = tables[table_id]
+        escape, literal_bits = (BYTES_ESCAPE, BYTES_LITERAL_BITS) if table.binary else (TEXT_ESCAPE, TEXT_LITERAL_BITS)
+        codes = encoding.canonical_codes(table.lengths)
+        prepared[table_id] = (encoding.bitarray_codes(codes),
+                              encoding.build_decode_table(codes, escape=escape, literal_bits=literal_bits))
+    return prepared[table_id]
+
+"""
+    Compresses one message against a registered static table.
+
+    The message is just its length as a varint followed by the encoded bits, with no code
+    table. Characters the table has no code for are written as the escape code followed by
+    their code point (21 bits) or byte value (8 bits).
+
+    Args:
+        message (string or bytes): The message to compress, text for text tables, bytes for bytes tables.
+        table_id (int): The ID of the table to compress against.
+
+    Returns:
+        bytes: The compressed message.
+"""
+def compress_message(message, table_id):
+    codes, _ = prepare_table(table_id)
+    table = tables[table_id]
+    if table.binary == isinstance(message, str):
+        raise TypeError("Text tables compress strings and bytes tables compress bytes")
+
+    missing = set(message) - codes.keys()
+    if missing:
+        escape, literal_bits = (BYTES_ESCAPE, BYTES_LITERAL_BITS) if table.binary else (TEXT_ESCAPE, TEXT_LITERAL_BITS)
+        codes = dict(codes)
+        for char in missing:
+            literal = char if table.binary else ord(char)
+            codes[char] = codes[escape] + bitarray(format(literal, f"0{literal_bits}b"))
+
+    encoded = bitarray()
+    if message:
+        encoded.encode(codes, message)
+    return encoding.encode_varint(len(message)) + encoded.tobytes()
+
+"""
+    Decompresses a message written by compress_message.
+
+    Args:
+        data (bytes): The compressed message.
+        table_id (int): The ID of the table it was compressed against.
+
+    Returns:
+        (string): The message, or bytes for bytes tables.
+"""
+def decompress_message(data, table_id):
+    _, decode_table = prepare_table(table_id)
+    message = io.BytesIO(data)
+    length = encoding.read_varint(message)
+    return encoding.decode_with_table(data[message.tell():], decode_table, length)
+
+
+# Example Usage
+if __name__ == "__main__":
+    # train <table file> <sample files...> trains a table from sample files and saves it
+    if len(sys.argv) >= 4 and sys.argv[1] == "train":
+        samples = []
+        for path in sys.argv[3:]:
+            with open(path, "r") as file:
+                samples.append(file.read())
+        table = train_table(samples)
+        output_path = save_table(table, sys.argv[2])
+        print(f"Static table {table.table_id:#010x} saved to {output_path}")
+    else:
+        print("Usage: python static_tables.py train <table_file> <sample_file.txt> [...]")
+        sys.exit(1)